@@ -4,7 +4,13 @@ This module defines the [`CodecStack`][numcodecs_combinators.stack.CodecStack] c
 
 __all__ = ["CodecStack"]
 
-from typing import TYPE_CHECKING, Callable, Optional
+import os
+import queue
+import threading
+from collections import OrderedDict
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Callable, Optional
 
 import numcodecs
 import numcodecs.compat
@@ -55,25 +61,43 @@ class CodecStack(Codec, CodecCombinatorMixin, tuple[Codec]):
     ```
     but makes use of knowing the shapes and dtypes of all intermediary encoding
     stages.
+
+    By default, nested single-codec stacks are collapsed on construction, i.e.
+    ```python
+    CodecStack(CodecStack(a), b)
+    ```
+    is the same as
+    ```python
+    CodecStack(a, b)
+    ```
+    since both encode and decode equivalently. Nested stacks with more than
+    one codec are kept, such that the length of the stack is unchanged. Pass
+    `flatten=False` to keep nested single-codec stacks as well. The nesting is
+    preserved in the config of the stack, such that instantiating a stack
+    from its config reproduces it exactly.
     """
 
     __slots__ = ()
 
     codec_id: str = "combinators.stack"  # type: ignore
 
-    def __init__(self, *args: dict | Codec):
+    def __init__(self, *args: dict | Codec, flatten: bool = True):
         pass
 
-    def __new__(cls, *args: dict | Codec) -> Self:
-        return super(CodecStack, cls).__new__(
-            cls,
-            tuple(
-                codec
-                if isinstance(codec, Codec)
-                else numcodecs.registry.get_codec(codec)
-                for codec in args
-            ),
-        )
+    def __new__(cls, *args: dict | Codec, flatten: bool = True) -> Self:
+        if not args and cls is CodecStack:
+            return _EMPTY_STACK  # type: ignore
+
+        get_codec = numcodecs.registry.get_codec
+
+        codecs = [
+            codec if isinstance(codec, Codec) else get_codec(codec) for codec in args
+        ]
+
+        if flatten:
+            codecs = [_collapse(codec) for codec in codecs]
+
+        return super(CodecStack, cls).__new__(cls, codecs)
 
     def encode(self, buf: Buffer) -> Buffer:
         """Encode the data in `buf`.
@@ -98,9 +122,7 @@ class CodecStack(Codec, CodecCombinatorMixin, tuple[Codec]):
 
         encoded = buf
         for codec in self:
-            encoded_ndarray = np.asarray(
-                numcodecs.compat.ensure_contiguous_ndarray_like(encoded, flatten=False)
-            )
+            encoded_ndarray = _ensure_contiguous_ndarray(encoded)
             encoded = codec.encode(
                 ChunkedNdArray(encoded_ndarray) if chunked else encoded_ndarray
             )
@@ -128,18 +150,131 @@ class CodecStack(Codec, CodecCombinatorMixin, tuple[Codec]):
             buffer protocol.
         """
 
+        if len(self) == 0:
+            if out is None:
+                return buf
+            return numcodecs.compat.ndarray_copy(buf, out)  # type: ignore
+
         decoded = buf
-        for codec in reversed(self):
-            decoded = codec.decode(
-                numcodecs.compat.ensure_contiguous_ndarray_like(decoded, flatten=False),
-                out=None,
-            )
+        for i in range(len(self) - 1, 0, -1):
+            decoded = self[i].decode(_ensure_contiguous_ndarray_like(decoded), out=None)
+
+        # the last decoding stage can directly decode into `out`
+        decoded = self[0].decode(_ensure_contiguous_ndarray_like(decoded), out=out)
+
+        if out is None or decoded is out:
+            return decoded
+
         return numcodecs.compat.ndarray_copy(decoded, out)  # type: ignore
 
+    def encode_pipelined(
+        self, bufs: Iterable[Buffer], maxsize: int = 1
+    ) -> Iterator[Buffer]:
+        """Encode each of the buffers in `bufs`, overlapping the encoding stages.
+
+        Every codec in the stack runs on its own worker thread and the stages
+        are connected by bounded queues, such that the `i`-th codec can encode
+        the `k`-th buffer while the `(i-1)`-th codec already encodes the
+        `(k+1)`-th buffer. This can speed up the encoding of many buffers if
+        the codecs release the GIL while encoding, as many compression codecs
+        do.
+
+        The encoded buffers are yielded in the same order as `bufs`, and each
+        encoded buffer is equivalent to `stack.encode(buf)`. If any codec
+        raises an exception, it is re-raised when the corresponding encoded
+        buffer would have been yielded.
+
+        Parameters
+        ----------
+        bufs : Iterable[Buffer]
+            Data to be encoded. Each buffer may be any object supporting the
+            new-style buffer protocol.
+        maxsize : int
+            Maximum number of buffers that are queued between two stages.
+
+        Returns
+        -------
+        encs : Iterator[Buffer]
+            Encoded data. Each encoded buffer may be any object supporting the
+            new-style buffer protocol.
+        """
+
+        if len(self) == 0:
+            yield from bufs
+            return
+
+        stop = threading.Event()
+        queues: list[queue.Queue] = [
+            queue.Queue(maxsize=maxsize) for _ in range(len(self) + 1)
+        ]
+
+        def feed() -> None:
+            try:
+                for buf in bufs:
+                    item = (buf, getattr(buf, "chunked", False))
+                    if not _pipeline_put(queues[0], item, stop):
+                        return
+            except BaseException as err:
+                _pipeline_put(queues[0], _PipelineError(err), stop)
+            else:
+                _pipeline_put(queues[0], _PIPELINE_END, stop)
+
+        def encode_stage(i: int, codec: Codec) -> None:
+            while True:
+                item = _pipeline_get(queues[i], stop)
+
+                if item is not _PIPELINE_END and not isinstance(item, _PipelineError):
+                    encoded, chunked = item
+                    try:
+                        encoded_ndarray = _ensure_contiguous_ndarray(encoded)
+                        encoded = codec.encode(
+                            ChunkedNdArray(encoded_ndarray)
+                            if chunked
+                            else encoded_ndarray
+                        )
+                    except BaseException as err:
+                        item = _PipelineError(err)
+                    else:
+                        item = (encoded, chunked)
+
+                if not _pipeline_put(queues[i + 1], item, stop) or (
+                    item is _PIPELINE_END
+                ):
+                    return
+
+        with ThreadPoolExecutor(max_workers=len(self) + 1) as executor:
+            try:
+                executor.submit(feed)
+                for i, codec in enumerate(self):
+                    executor.submit(encode_stage, i, codec)
+
+                while True:
+                    item = queues[-1].get()
+
+                    if item is _PIPELINE_END:
+                        return
+                    if isinstance(item, _PipelineError):
+                        raise item.err
+
+                    encoded, _chunked = item
+                    if getattr(encoded, "chunked", False):
+                        encoded = np.array(encoded).view(np.ndarray)
+                    yield encoded
+            finally:
+                # unblock all workers if the pipeline is stopped early
+                stop.set()
+
     def encode_decode(self, buf: Buffer) -> Buffer:
         """
         Encode, then decode the data in `buf`.
 
+        If the `NUMCODECS_COMBINATORS_SCRATCH_POOL` environment variable is set
+        to `1`, the buffers for the intermediary decoding stages are taken
+        from and returned to a small per-thread pool, such that repeated calls
+        with the same shapes and dtypes can reuse them. Do *not* enable the
+        pool if any codec in the stack retains a reference to the `out` buffer
+        that is passed to its `decode` method.
+
         Parameters
         ----------
         buf : Buffer
@@ -150,35 +285,69 @@ class CodecStack(Codec, CodecCombinatorMixin, tuple[Codec]):
         -------
         dec : Buffer
             Decoded data. May be any object supporting the new-style
-            buffer protocol.
+            buffer protocol. If `buf` is an array, the decoded data is
+            returned as a view of the same array type without copying.
         """
 
-        chunked = getattr(buf, "chunked", False)
+        n_codecs = len(self)
 
-        encoded = np.asarray(
-            numcodecs.compat.ensure_contiguous_ndarray_like(buf, flatten=False)
-        )
-        silhouettes = []
+        if n_codecs == 0:
+            return buf
 
-        for codec in self:
-            silhouettes.append((encoded.shape, encoded.dtype))
-            encoded = np.asarray(
-                numcodecs.compat.ensure_contiguous_ndarray_like(
-                    codec.encode(ChunkedNdArray(encoded) if chunked else encoded),
-                    flatten=False,
-                )
-            )
+        chunked = getattr(buf, "chunked", False)
 
-        decoded = encoded.view(np.ndarray)
+        encoded = _ensure_contiguous_ndarray(buf)
 
-        for codec in reversed(self):
-            shape, dtype = silhouettes.pop()
+        if n_codecs == 1:
+            # fast path for a single codec, which does not need to keep track
+            #  of any intermediary shapes and dtypes or scratch buffers
+            codec, shape, dtype = self[0], encoded.shape, encoded.dtype
+            encoded = _ensure_contiguous_ndarray(
+                codec.encode(ChunkedNdArray(encoded) if chunked else encoded)
+            )
             out = np.empty(shape=shape, dtype=dtype)
-            decoded = (
-                codec.decode(decoded, ChunkedNdArray(out) if chunked else out)
-                .view(dtype)
-                .reshape(shape)
+            decoded = _view_as(
+                codec.decode(
+                    encoded.view(np.ndarray), ChunkedNdArray(out) if chunked else out
+                ),
+                shape,
+                dtype,
             )
+        else:
+            # the shapes and dtypes of the input to each encoding stage
+            shapes: list[tuple[int, ...]] = [()] * n_codecs
+            dtypes: list[np.dtype] = [encoded.dtype] * n_codecs
+
+            for i, codec in enumerate(self):
+                shapes[i] = encoded.shape
+                dtypes[i] = encoded.dtype
+                encoded = _ensure_contiguous_ndarray(
+                    codec.encode(ChunkedNdArray(encoded) if chunked else encoded)
+                )
+
+            decoded = encoded.view(np.ndarray)
+
+            reuse_scratch = _scratch_pool_enabled()
+            scratch = None
+
+            for i in range(n_codecs - 1, -1, -1):
+                codec, shape, dtype = self[i], shapes[i], dtypes[i]
+                out = (
+                    _get_scratch(shape, dtype)
+                    if reuse_scratch
+                    else np.empty(shape=shape, dtype=dtype)
+                )
+                decoded = _view_as(
+                    codec.decode(decoded, ChunkedNdArray(out) if chunked else out),
+                    shape,
+                    dtype,
+                )
+
+                # the previous stage's output buffer can be reused once the
+                #  decoded data no longer refers to it
+                if scratch is not None and not np.may_share_memory(decoded, scratch):
+                    _release_scratch(scratch)
+                scratch = out if reuse_scratch else None
 
         if getattr(decoded, "chunked", False):
             decoded = decoded.view(np.ndarray)
@@ -186,6 +355,11 @@ class CodecStack(Codec, CodecCombinatorMixin, tuple[Codec]):
         if isinstance(decoded, type(buf)):
             return decoded
 
+        # return ndarray (subclasses) as views instead of calling the
+        #  subclass constructor
+        if isinstance(buf, np.ndarray):
+            return decoded.view(type(buf))
+
         return type(buf)(decoded)  # type: ignore
 
     def encode_decode_data_array(self, da: "xr.DataArray") -> "xr.DataArray":
@@ -222,28 +396,28 @@ class CodecStack(Codec, CodecCombinatorMixin, tuple[Codec]):
         if da.chunks is None:
             return da.copy(data=self.encode_decode(da.values))  # type: ignore
 
-        def encode_decode_data_array_single_chunk(
-            da: xr.DataArray,
-        ) -> xr.DataArray:
-            single_chunk = {dim: -1 for dim in da.dims}
-
+        def encode_decode_single_chunk(chunk: np.ndarray) -> np.ndarray:
             # return early for zero-sized arrays
-            if da.size == 0:
-                return da.copy(deep=False).chunk(single_chunk)
+            if chunk.size == 0:
+                return chunk
 
-            # eagerly compute the input chunk and encode and decode it
+            # encode and decode the input chunk
             decoded = self.encode_decode(
                 ChunkedNdArray(  # type: ignore
                     # ensure that the array is contiguous, copying if necessary
-                    np.ascontiguousarray(da.values).reshape(da.shape)
+                    np.ascontiguousarray(chunk)
                 )
             )
 
-            return da.copy(deep=False, data=np.array(decoded).view(np.ndarray)).chunk(
-                single_chunk
-            )
+            return np.array(decoded).view(np.ndarray)
 
-        return xr.map_blocks(encode_decode_data_array_single_chunk, da)
+        return xr.apply_ufunc(
+            encode_decode_single_chunk,
+            da,
+            dask="parallelized",
+            output_dtypes=[da.dtype],
+            keep_attrs=True,
+        )
 
     def get_config(self) -> dict:
         """
@@ -279,7 +453,8 @@ class CodecStack(Codec, CodecCombinatorMixin, tuple[Codec]):
             Instantiated codec stack.
         """
 
-        return cls(*config["codecs"])
+        # keep any nested stacks that are explicitly stored in the config
+        return cls(*config["codecs"], flatten=False)
 
     def __repr__(self) -> str:
         repr = ", ".join(f"{codec!r}" for codec in self)
@@ -290,6 +465,8 @@ class CodecStack(Codec, CodecCombinatorMixin, tuple[Codec]):
         """
         Apply the `mapper` to all codecs that are in this stack.
         In the returned stack, each codec is replaced by its mapped codec.
+        Mapped codecs that are single-codec stacks are collapsed into their
+        only codec, such that repeated mapping does not nest ever deeper.
 
         The `mapper` should recursively apply itself to any inner codecs that
         also implement the [`CodecCombinatorMixin`][numcodecs_combinators.abc.CodecCombinatorMixin]
@@ -314,16 +491,142 @@ class CodecStack(Codec, CodecCombinatorMixin, tuple[Codec]):
             The mapped codec stack.
         """
 
-        return CodecStack(*map(mapper, self))
+        # the mapped codecs only need to be collapsed, not validated
+        mapped = tuple(_collapse(mapper(codec)) for codec in self)
+        assert all(isinstance(codec, Codec) for codec in mapped), (
+            "mapper must return codecs"
+        )
+
+        return CodecStack._unchecked(mapped)
+
+    @classmethod
+    def _unchecked(cls, codecs: tuple[Codec, ...]) -> Self:
+        # construct the stack from already validated and flattened codecs
+        if not codecs and cls is CodecStack:
+            return _EMPTY_STACK  # type: ignore
+
+        return super(CodecStack, cls).__new__(cls, codecs)
 
     def __add__(self, other) -> "CodecStack":
+        if type(other) is CodecStack:
+            return CodecStack._unchecked(tuple.__add__(self, other))
         return CodecStack(*tuple.__add__(self, other))
 
     def __mul__(self, other) -> "CodecStack":
-        return CodecStack(*tuple.__mul__(self, other))
+        return CodecStack._unchecked(tuple.__mul__(self, other))
 
     def __rmul__(self, other) -> "CodecStack":
-        return CodecStack(*tuple.__rmul__(self, other))
+        return CodecStack._unchecked(tuple.__rmul__(self, other))
+
+
+def _ensure_contiguous_ndarray_like(buf: Buffer) -> Buffer:
+    # fast path: C-contiguous ndarrays that are not of object or datetime
+    #  dtype would be returned unchanged by ensure_contiguous_ndarray_like
+    if (
+        type(buf) is np.ndarray
+        and buf.flags.c_contiguous
+        and buf.dtype.kind not in "OMm"
+    ):
+        return buf
+
+    return numcodecs.compat.ensure_contiguous_ndarray_like(buf, flatten=False)  # type: ignore
+
+
+def _ensure_contiguous_ndarray(buf: Buffer) -> np.ndarray:
+    arr = _ensure_contiguous_ndarray_like(buf)
+
+    # only convert ndarray subclasses and other ndarray-likes
+    if type(arr) is np.ndarray:
+        return arr
+
+    return np.asarray(arr)
+
+
+def _collapse(codec: Codec) -> Codec:
+    # a single-codec stack encodes and decodes the same as its only codec
+    while type(codec) is CodecStack and len(codec) == 1:
+        codec = codec[0]
+
+    return codec
+
+
+def _view_as(arr: np.ndarray, shape: tuple[int, ...], dtype: np.dtype) -> np.ndarray:
+    # codecs that decode into the provided `out` buffer already return an
+    #  array with the expected shape and dtype, only other codecs need a view
+    if arr.dtype == dtype and arr.shape == shape:
+        return arr
+
+    return arr.view(dtype).reshape(shape)
+
+
+# the empty stack is immutable and can thus be shared
+_EMPTY_STACK: CodecStack = tuple.__new__(CodecStack, ())
+
+_SCRATCH_POOL_ENV = "NUMCODECS_COMBINATORS_SCRATCH_POOL"
+_SCRATCH_POOL_SIZE = 16
+_scratch_pool = threading.local()
+
+
+def _scratch_pool_enabled() -> bool:
+    return os.environ.get(_SCRATCH_POOL_ENV, "0") == "1"
+
+
+def _get_scratch(shape: tuple[int, ...], dtype: np.dtype) -> np.ndarray:
+    pool: Optional[OrderedDict] = getattr(_scratch_pool, "buffers", None)
+
+    if pool is not None:
+        scratch = pool.pop((shape, dtype), None)
+        if scratch is not None:
+            return scratch
+
+    return np.empty(shape=shape, dtype=dtype)
+
+
+def _release_scratch(scratch: np.ndarray) -> None:
+    pool: Optional[OrderedDict] = getattr(_scratch_pool, "buffers", None)
+
+    if pool is None:
+        pool = _scratch_pool.buffers = OrderedDict()
+
+    # keep only the most recently released buffer per shape and dtype, and
+    #  evict the least recently released buffers once the pool is full
+    key = (scratch.shape, scratch.dtype)
+    pool[key] = scratch
+    pool.move_to_end(key)
+
+    if len(pool) > _SCRATCH_POOL_SIZE:
+        pool.popitem(last=False)
+
+
+_PIPELINE_END = object()
+_PIPELINE_POLL_INTERVAL = 0.1
+
+
+class _PipelineError:
+    __slots__: tuple[str, ...] = ("err",)
+    err: BaseException
+
+    def __init__(self, err: BaseException) -> None:
+        self.err = err
+
+
+def _pipeline_put(q: queue.Queue, item: Any, stop: threading.Event) -> bool:
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=_PIPELINE_POLL_INTERVAL)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _pipeline_get(q: queue.Queue, stop: threading.Event) -> Any:
+    while not stop.is_set():
+        try:
+            return q.get(timeout=_PIPELINE_POLL_INTERVAL)
+        except queue.Empty:
+            pass
+    return _PIPELINE_END
 
 
 numcodecs.registry.register_codec(CodecStack)
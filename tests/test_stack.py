@@ -1,5 +1,6 @@
 import numcodecs
 import numpy as np
+import pytest
 import xarray as xr
 from numcodecs.abc import Codec
 
@@ -17,6 +18,8 @@ def test_init_config():
     stack = CodecStack()
     assert len(stack) == 0
     assert_config_roundtrip(stack)
+    assert stack * 0 is stack
+    assert 0 * CodecStack(numcodecs.CRC32()) is stack
 
     stack = CodecStack(dict(id="zlib", level=9))
     assert len(stack) == 1
@@ -26,6 +29,26 @@ def test_init_config():
     assert len(stack) == 2
     assert_config_roundtrip(stack)
 
+    # mutating the returned config must not affect the stack
+    config = stack.get_config()
+    config["codecs"][0]["level"] = 1
+    assert stack.get_config()["codecs"][0]["level"] == 9
+
+    # ... not even the nested configs of inner stacks
+    stack = CodecStack(
+        CodecStack(numcodecs.Zlib(level=9), flatten=False), flatten=False
+    )
+    config = stack.get_config()
+    config["codecs"][0]["codecs"][0]["level"] = 1
+    assert stack.get_config()["codecs"][0]["codecs"][0]["level"] == 9
+
+    # the config must reflect mutations of the codecs in the stack
+    stack = CodecStack(numcodecs.Zlib(level=1))
+    assert stack == CodecStack(numcodecs.Zlib(level=1))
+    stack[0].level = 9
+    assert stack.get_config()["codecs"][0]["level"] == 9
+    assert stack != CodecStack(numcodecs.Zlib(level=1))
+
 
 def test_encode_decode():
     stack = CodecStack(numcodecs.Zlib(level=9), numcodecs.CRC32())
@@ -40,9 +63,22 @@ def test_encode_decode():
     assert stack_decoded == decoded
     assert stack_decoded == b"abc"
 
+    out = np.empty(3, dtype=np.uint8)
+    stack_decoded = stack.decode(stack_encoded, out=out)
+    assert stack_decoded is out
+    assert bytes(out) == b"abc"
+
     encoded_decoded = stack.encode_decode(b"abc")
     assert encoded_decoded == b"abc"
 
+    encoded_decoded = stack.encode_decode(memoryview(b"abc"))
+    assert type(encoded_decoded) is memoryview
+    assert encoded_decoded == b"abc"
+
+    encoded_decoded = stack.encode_decode(bytearray(b"abc"))
+    assert type(encoded_decoded) is bytearray
+    assert encoded_decoded == b"abc"
+
     encoded_decoded = stack.encode_decode_data_array(xr.DataArray([1.0, 2.0, 3.0]))
     assert encoded_decoded.equals(xr.DataArray([1.0, 2.0, 3.0]))
 
@@ -92,25 +128,121 @@ def test_chunked_encode_decode_non_contiguous():
     CodecStack().encode_decode_data_array(da_chunked).compute()
 
 
+def test_flatten():
+    zlib, crc32 = numcodecs.Zlib(level=9), numcodecs.CRC32()
+
+    nested = CodecStack(CodecStack(zlib), crc32, flatten=False)
+    assert len(nested) == 2
+    assert nested[0] == CodecStack(zlib)
+
+    flat = CodecStack(CodecStack(zlib), crc32)
+    assert len(flat) == 2
+    assert flat[0] is zlib
+    assert flat == CodecStack(zlib, crc32)
+    assert flat != nested
+
+    # only single-codec stacks are collapsed
+    multi = CodecStack(CodecStack(zlib, crc32), crc32)
+    assert len(multi) == 2
+    assert multi[0] == CodecStack(zlib, crc32)
+    assert CodecStack(CodecStack(CodecStack(zlib), flatten=False))[0] is zlib
+
+    # the nesting survives a config roundtrip
+    assert_config_roundtrip(nested)
+    assert_config_roundtrip(flat)
+
+    data = np.arange(100, dtype=np.float64)
+    assert (np.array(nested.encode(data)) == np.array(flat.encode(data))).all()
+    assert np.all(nested.encode_decode(data) == flat.encode_decode(data))
+
+
 def test_map():
     stack = CodecStack(numcodecs.Zlib(level=9), numcodecs.CRC32())
 
     mapped = numcodecs_combinators.map_codec(stack, lambda c: c)
     assert mapped == stack
 
+    # each codec is replaced by exactly its mapped codec
+    mapped = stack.map(lambda c: CodecStack(c, numcodecs.Zlib()))
+    assert len(mapped) == 2
+
+    def nest(*codecs):
+        return CodecStack(*codecs, flatten=False)
+
+    # mapped single-codec stacks are collapsed, only the outermost wrapping
+    #  by the mapper remains
     mapped = numcodecs_combinators.map_codec(stack, lambda c: CodecStack(c))
-    assert mapped == CodecStack(
-        CodecStack(CodecStack(numcodecs.Zlib(level=9)), CodecStack(numcodecs.CRC32()))
-    )
+    assert mapped == nest(nest(numcodecs.Zlib(level=9), numcodecs.CRC32()))
+    assert mapped != stack
+
+    # repeated mapping does not nest any deeper
+    for _ in range(3):
+        mapped = numcodecs_combinators.map_codec(mapped, lambda c: CodecStack(c))
+        assert mapped == nest(nest(numcodecs.Zlib(level=9), numcodecs.CRC32()))
 
-    mapped = numcodecs_combinators.map_codec(mapped, lambda c: CodecStack(c))
-    assert mapped == CodecStack(
-        CodecStack(
-            CodecStack(
-                CodecStack(
-                    CodecStack(CodecStack(CodecStack(numcodecs.Zlib(level=9)))),
-                    CodecStack(CodecStack(CodecStack(numcodecs.CRC32()))),
-                )
-            )
-        )
+    # non-flattening stacks are collapsed inside the mapped stack as well
+    mapped = numcodecs_combinators.map_codec(stack, nest)
+    assert mapped == nest(nest(numcodecs.Zlib(level=9), numcodecs.CRC32()))
+
+    mapped = numcodecs_combinators.map_codec(mapped, nest)
+    assert mapped == nest(
+        nest(nest(numcodecs.Zlib(level=9), numcodecs.CRC32())),
     )
+
+
+def test_encode_decode_scratch_pool(monkeypatch):
+    monkeypatch.setenv("NUMCODECS_COMBINATORS_SCRATCH_POOL", "1")
+
+    stack = CodecStack(numcodecs.Zlib(level=9), numcodecs.CRC32())
+
+    results = []
+    for i in range(4):
+        data = np.arange(i * 10, i * 10 + 100, dtype=np.float64)
+        encoded_decoded = stack.encode_decode(data)
+        assert np.all(encoded_decoded == data)
+        results.append((encoded_decoded, data))
+
+    # earlier results must not be overwritten by reused buffers
+    for encoded_decoded, data in results:
+        assert np.all(encoded_decoded == data)
+
+    # the intermediary zlib-encoded buffer is returned to the pool ...
+    data = np.zeros(100, dtype=np.float64)
+    intermediary = numcodecs.Zlib(level=9).encode(data)
+    key = ((len(intermediary),), np.dtype(np.uint8))
+
+    assert np.all(stack.encode_decode(data) == data)
+    scratch = numcodecs_combinators.stack._scratch_pool.buffers[key]
+
+    # ... and reused by the next call with the same shapes and dtypes
+    assert np.all(stack.encode_decode(data) == data)
+    assert numcodecs_combinators.stack._scratch_pool.buffers[key] is scratch
+
+
+def test_encode_pipelined():
+    stack = CodecStack(numcodecs.Zlib(level=9), numcodecs.CRC32())
+
+    bufs = [np.arange(i, i + 100, dtype=np.float64) for i in range(10)]
+
+    for encoded, buf in zip(stack.encode_pipelined(bufs), bufs, strict=True):
+        assert (np.array(encoded) == np.array(stack.encode(buf))).all()
+
+    assert list(CodecStack().encode_pipelined([b"abc"])) == [b"abc"]
+
+    # stopping early must not deadlock the pipeline
+    encoded = stack.encode_pipelined(iter(bufs))
+    next(encoded)
+    encoded.close()
+
+    class FailingCodec(Codec):
+        codec_id = "failing"
+
+        def encode(self, buf):
+            raise ValueError("failing codec")
+
+        def decode(self, buf, out=None):
+            raise NotImplementedError
+
+    encoded = CodecStack(numcodecs.Zlib(), FailingCodec()).encode_pipelined(bufs)
+    with pytest.raises(ValueError, match="failing codec"):
+        next(encoded)